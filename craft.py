@@ -6,15 +6,28 @@
 # ---------------------------
 # Top-level manager.
 
-import os, sys, io
+import os, sys, io, errno
 import subprocess
 import time, signal, socket
-import argparse
+import argparse, tempfile, shutil
 
 RECORDER_HOST = "localhost"
 RECORDER_PORT = 8081
 THIS_DIR = os.path.dirname(__file__)
 
+ABORT_DRAIN = "drain" # run no new commands, but let running ones finish
+ABORT_KILL  = "kill"  # terminate Make and the commands it is running
+
+# in drain mode, observer refuses to run commands once the stop file exists
+STOP_FILE_NAME = "stop"
+STOP_FILE_ENV = "CRAFT_STOP_FILE" # must match observer.c
+
+make_proc = None # the running Make process, in its own process group in kill mode
+make_has_terminal = False # if True, Make's process group is the terminal's foreground
+make_aborted = False
+abort_mode = None # ABORT_DRAIN or ABORT_KILL, if aborting is enabled
+stop_dir = None # private directory holding the stop file, if aborting is enabled
+
 class cd:
     def __init__(self, to_path):
         self.to_path = to_path
@@ -45,6 +58,7 @@ def wait_server_ready():
     return True
 
 def work(args, make_cmd):
+    global make_proc, make_has_terminal, abort_mode, stop_dir
     # no need to check 'make_cmd' against injection hazard - this is user's Make command and
     # users can wrack their computer with that command all they want
     make_working_dir = get_make_working_dir(make_cmd)
@@ -58,18 +72,43 @@ def work(args, make_cmd):
 
     compile_observer_if_needed() # ensure up-to-date observer
 
-    recorder_proc = subprocess.Popen("%s/recorder.py" % THIS_DIR)
+    recorder_cmd = ["%s/recorder.py" % THIS_DIR]
+    if args.fail_fast or args.abort_after > 0:
+        recorder_cmd.append("--fail-fast")
+    if args.abort_after > 0:
+        recorder_cmd += ["--abort-after", str(args.abort_after),
+                         "--notify-pid", str(os.getpid())]
+    recorder_proc = subprocess.Popen(recorder_cmd)
     if False == wait_server_ready():
         return 1
+    make_env, make_preexec = None, None
+    if args.abort_after > 0:
+        abort_mode = args.abort_mode
+        stop_dir = tempfile.mkdtemp(prefix="craft-")
+        make_env = dict(os.environ)
+        make_env[STOP_FILE_ENV] = os.path.join(stop_dir, STOP_FILE_NAME)
+    if abort_mode == ABORT_KILL:
+        # Make and the commands it spawns are put in a new process group, so they can be
+        # terminated together; the group is given the terminal, if we have it
+        make_has_terminal = owns_terminal()
+        make_preexec = enter_foreground_group if make_has_terminal else os.setpgrp
     print("craft: %s" % make_cmd)
     with open(os.devnull, 'w') as DEVNULL: # Python2.7 doesn't have subprocess.DEVNULL
         # Make's stderr is still streamed
-        make_proc = subprocess.Popen(make_cmd_with_observer, shell=True, stdout=DEVNULL)
-        make_proc.wait()
+        make_proc = subprocess.Popen(make_cmd_with_observer, shell=True, stdout=DEVNULL,
+                                     env=make_env, preexec_fn=make_preexec)
+        if make_has_terminal:
+            wait_make_job_control()
+        else:
+            make_proc.wait()
+    reclaim_terminal()
+    remove_stop_dir()
     if args.write_log:
         subprocess.call("%s/observer :close %s" % (THIS_DIR, args.write_log), shell=True)
     else:
         subprocess.call("%s/observer :close" % THIS_DIR, shell=True)
+    if make_aborted:
+        return 1
     return make_proc.poll() # get Make's exit status
 
 def get_make_working_dir(make_cmd):
@@ -95,6 +134,92 @@ def compile_observer_if_needed():
         with open(os.devnull, 'w') as DEVNULL: # Python2.7 doesn't have subprocess.DEVNULL
             subprocess.call("make -f utils/auto.make".split(), stdout=DEVNULL)
 
+def owns_terminal():
+    try:
+        return os.isatty(0) and os.tcgetpgrp(0) == os.getpgrp()
+    except OSError:
+        return False
+
+def set_terminal_foreground(pgid):
+    # SIGTTOU is sent if the caller is in a background process group
+    handler = signal.signal(signal.SIGTTOU, signal.SIG_IGN)
+    try:
+        os.tcsetpgrp(0, pgid)
+    finally:
+        signal.signal(signal.SIGTTOU, handler)
+
+def enter_foreground_group(): # runs in Make's process before exec
+    os.setpgrp()
+    set_terminal_foreground(os.getpgrp())
+
+def reclaim_terminal():
+    global make_has_terminal
+    if make_has_terminal:
+        make_has_terminal = False
+        set_terminal_foreground(os.getpgrp())
+
+def create_stop_file():
+    # the directory is private, but still refuse to follow a planted file
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+    os.close(os.open(os.path.join(stop_dir, STOP_FILE_NAME), flags, 0o600))
+
+def wait_make_job_control():
+    # Make's group has the terminal, so Ctrl-Z stops Make but not us, and the shell would
+    # never regain the terminal: pass the stop on to our own group, and resume Make after
+    global make_has_terminal
+    while make_proc.returncode == None:
+        try:
+            pid, status = os.waitpid(make_proc.pid, os.WUNTRACED)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            if e.errno == errno.ECHILD: # reaped by poll() in a signal handler
+                break
+            raise
+        if os.WIFSTOPPED(status):
+            reclaim_terminal()
+            os.killpg(os.getpgrp(), signal.SIGTSTP) # returns when the shell resumes us
+            if owns_terminal(): # resumed in the foreground, not with 'bg'
+                make_has_terminal = True
+                set_terminal_foreground(make_proc.pid)
+            os.killpg(make_proc.pid, signal.SIGCONT)
+        elif os.WIFSIGNALED(status):
+            make_proc.returncode = -os.WTERMSIG(status)
+        else:
+            make_proc.returncode = os.WEXITSTATUS(status)
+
+def remove_stop_dir():
+    global stop_dir
+    if stop_dir:
+        shutil.rmtree(stop_dir, ignore_errors=True)
+        stop_dir = None
+
+def terminate_make():
+    if make_proc and make_proc.poll() == None:
+        try:
+            os.killpg(make_proc.pid, signal.SIGTERM)
+        except OSError: # no such process group, or already gone
+            pass
+
+def abort_handler(sig, frame): # SIGUSR1 is sent by recorder
+    global make_aborted
+    # reports reach recorder asynchronously, so Make may have exited already
+    if make_aborted or make_proc == None or make_proc.poll() != None:
+        return
+    make_aborted = True
+    if abort_mode == ABORT_DRAIN:
+        print("[Error] craft: failure limit reached, waiting for running commands")
+        create_stop_file()
+    else:
+        print("[Error] craft: failure limit reached, terminating Make")
+        terminate_make()
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("expected a positive integer, got %s" % value)
+    return number
+
 def sighandler(sig, frame):
     if sig == signal.SIGINT:
         print(" [SIGNAL] SIGINT sent to script")
@@ -102,12 +227,17 @@ def sighandler(sig, frame):
         print(" [SIGNAL] SIGTERM sent to script")
     else:
         print(" [SIGNAL] Signal %d sent to script" % sig)
+    if abort_mode == ABORT_KILL:
+        terminate_make() # Make is in its own process group, so it would not see the signal
+    reclaim_terminal()
+    remove_stop_dir()
     sys.exit(1)
 
 def main():
     # Set the signal handlers
     signal.signal(signal.SIGINT, sighandler)
     signal.signal(signal.SIGTERM, sighandler)
+    signal.signal(signal.SIGUSR1, abort_handler)
 
     parser = argparse.ArgumentParser(description="Craft",
                                      epilog="if '-- ..' exists, args after '--' are passed to Make")
@@ -115,6 +245,14 @@ def main():
                         help="write log to file (JSON)")
     parser.add_argument("-p", "--prepare-observer", action='store_true',
                         help="compile observer only, and exit")
+    parser.add_argument("-f", "--fail-fast", action='store_true',
+                        help="print a failed command's stderr immediately")
+    parser.add_argument("-a", "--abort-after", metavar='N', type=positive_int, default=0,
+                        help="stop Make after N failed commands (implies --fail-fast)")
+    parser.add_argument("--abort-mode", choices=[ABORT_DRAIN, ABORT_KILL], default=ABORT_DRAIN,
+                        help="with -a, '%s': run no new commands and wait for running ones, "
+                             "'%s': terminate running commands (default: %%(default)s)" % (
+                             ABORT_DRAIN, ABORT_KILL))
     def preprocess(argv):
         if len(argv) == 0 or ("--" not in argv):
             return argv[1:], []
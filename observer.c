@@ -16,6 +16,9 @@
 static const char *kRecorderHost = "localhost";
 static const int kRecorderPort = 8081;
 
+/* the manager creates this file when the build is aborted; must match craft.py */
+static const char *kStopFileEnv = "CRAFT_STOP_FILE";
+
 int runCommand(char *cmd[]) {
     /* setting up two pipes */
     int stdoutPipe[2];
@@ -138,6 +141,12 @@ int writeString(int fd, const char *str, size_t len) {
     return kClientSendDataSuccess;
 }
 
+/* returns 1 if the manager asked not to run new commands, 0 otherwise */
+static int buildStopped() {
+    const char *stopFile = getenv(kStopFileEnv);
+    return stopFile && access(stopFile, F_OK) == 0;
+}
+
 static void sigHandler(int sig) {
     printSignal(stderr, sig);
     exit(1); /* Exit the process, otherwise it keeps running into
@@ -152,5 +161,9 @@ int main(int argc, char *argv[]) {
 		fprintf(stderr, "[Error] observer: no command\n");
 		return 1;
 	}
+	if (buildStopped()) {
+		fprintf(stderr, "[Error] observer: build aborted, skipped: %s\n", argv[1]);
+		return 1;
+	}
 	return runCommand(argv + 1);
 }
@@ -20,17 +20,28 @@
 #   ./observer :close log.json
 # Then kill recorder.py. A log.json file is dumped and you can inspect
 # it - it contains the commands you ran and their outputs and exit codes.
+#
+# Fail-fast: launched with '--fail-fast', the recorder prints a failed
+# command's stderr right away; with '--abort-after N --notify-pid PID',
+# it also sends SIGUSR1 to process PID (the manager) at the N-th failed
+# command, so the manager can stop Make.
 
 # NOTE 'asyncio' library is not in Python until Python 3, but we want
 #       to support both Python 2.7 and 3. So, we stick to 'asyncore'.
 import asyncore
 import socket
 import signal
-import sys, re, json, time
+import os, sys, re, json, time
+import argparse
 from utils import formatter
 
 record = {}
 
+fail_fast = False  # if True, print a failed command's stderr immediately
+abort_after = 0    # if positive, notify the manager after this many failures
+notify_pid = None  # the manager's pid, to which SIGUSR1 is sent
+failure_count = 0
+
 RECORDER_HOST = "localhost"
 RECORDER_PORT = 8081  # used by observer to send data
 
@@ -75,6 +86,23 @@ def handle_data(data):
     record[time.time()] = data_dict
     processed_line, category = formatter.process(data_dict["cmd"])
     print("%s" % processed_line)
+    if data_dict.get("exit") == "1":
+        handle_failure(data_dict)
+
+def handle_failure(data_dict):
+    global failure_count
+    failure_count += 1
+    if fail_fast:
+        sys.stderr.write("[Failed] %s\n" % data_dict["cmd"])
+        if data_dict.get("err"):
+            sys.stderr.write("%s\n" % data_dict["err"])
+        sys.stderr.flush()
+    if notify_pid and abort_after > 0 and failure_count == abort_after:
+        # the manager stops Make on SIGUSR1
+        try:
+            os.kill(notify_pid, signal.SIGUSR1)
+        except OSError: # the manager is already gone
+            pass
 
 class Handler(asyncore.dispatcher):
     def handle_read(self):
@@ -119,7 +147,22 @@ def sighandler(sig, frame):
         print(" [SIGNAL] recorder: signal %s sent to script" % sig)
     sys.exit(1)
 
+def parse_args():
+    global fail_fast, abort_after, notify_pid
+    parser = argparse.ArgumentParser(description="Craft recorder")
+    parser.add_argument("--fail-fast", action='store_true',
+                        help="print a failed command's stderr immediately")
+    parser.add_argument("--abort-after", metavar='N', type=int, default=0,
+                        help="send SIGUSR1 to the manager after N failed commands")
+    parser.add_argument("--notify-pid", metavar='PID', type=int, default=None,
+                        help="the manager's pid; without it, --abort-after has no effect")
+    args = parser.parse_args()
+    fail_fast = args.fail_fast
+    abort_after = args.abort_after
+    notify_pid = args.notify_pid
+
 if __name__ == "__main__":
+    parse_args()
     # Set the signal handlers
     signal.signal(signal.SIGINT, sighandler)
     signal.signal(signal.SIGABRT, sighandler)
@@ -14,6 +14,9 @@ LOG_FILENAME = "log.json"
 EXAMPLE_LOG_FILENAME = "example-log.json"
 OUT_FILENAME = "stdout.txt"
 EXAMPLE_OUT_FILENAME = "example-out.txt"
+FAIL_MAKEFILE = "fail.make" # under tests/
+FAIL_STDERR = "error: broken is broken"
+FAIL_SLOW_TIME = 3.0 # how long the sibling of the failed command runs
 
 def compare_log(actual, expected):
     min_start_real_time, max_finish_real_time = 2 ** 63 - 1, 0
@@ -71,6 +74,30 @@ def compare_out(actual, expected):
     expected_strings = sorted([ l.strip() for l in open(expected, 'r') if len(l.strip()) ])
     return actual_strings == expected_strings
 
+def run_craft(craft_args):
+    start_time = time.time()
+    craft_proc = subprocess.Popen("./craft.py %s" % craft_args, shell=True,
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = craft_proc.communicate()[0].decode()
+    return craft_proc.returncode, output, time.time() - start_time
+
+def check_fail_fast():
+    has_error = False
+    make_args = "-C tests -f %s -k -j2" % FAIL_MAKEFILE
+    status, output, elapse = run_craft("-f -- %s" % make_args)
+    if FAIL_STDERR not in output:
+        print("fail-fast: stderr of the failed command not printed")
+        has_error = True
+    status, output, elapse = run_craft("-a 1 --abort-mode kill -- %s" % make_args)
+    if status == 0 or elapse >= FAIL_SLOW_TIME:
+        print("fail-fast: build not terminated (exit %d, %.2f sec)" % (status, elapse))
+        has_error = True
+    status, output, elapse = run_craft("-a 1 -- %s" % make_args)
+    if status == 0 or elapse < FAIL_SLOW_TIME or "skipped: echo" not in output:
+        print("fail-fast: build not drained (exit %d, %.2f sec)" % (status, elapse))
+        has_error = True
+    return not has_error
+
 def main():
     if os.path.isfile("./observer"):
         os.remove("./observer")
@@ -88,6 +115,9 @@ def main():
     if False == compare_out(OUT_FILENAME, EXAMPLE_OUT_FILENAME):
         has_error = True
         print("[Error] stdout output is wrong")
+    if False == check_fail_fast():
+        has_error = True
+        print("[Error] fail-fast is wrong")
     if not has_error:
         print("OK.")
         os.remove(LOG_FILENAME)